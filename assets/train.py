@@ -1,6 +1,4 @@
 import os
-import numpy as np
-import cv2
 import tensorflow as tf
 from tensorflow.keras import layers, models, optimizers
 from tensorflow.keras import mixed_precision
@@ -13,69 +11,96 @@ if gpus:
     try:
         for gpu in gpus:
             tf.config.experimental.set_memory_growth(gpu, True)
-        # float16 math reduces VRAM usage by 50%
-        mixed_precision.set_global_policy('mixed_float16') 
-        print("✅ GPU Configured: Mixed Precision Active")
+        # 16-bit math halves VRAM usage, but only pays off where the GPU
+        # accelerates it:
+        #   Ampere+ (8.x, e.g. RTX 3050): bfloat16 — FP32 exponent range, no loss scaling
+        #   Volta/Turing (7.x): float16 Tensor Cores
+        #   older: no Tensor Cores — mixed precision is slower than plain FP32
+        cc = tf.config.experimental.get_device_details(gpus[0]).get('compute_capability') or (0, 0)
+        if cc >= (8, 0):
+            policy = 'mixed_bfloat16'
+        elif cc >= (7, 0):
+            policy = 'mixed_float16'
+        else:
+            policy = 'float32'
+        mixed_precision.set_global_policy(policy)
+        print(f"✅ GPU Configured: {policy} (compute capability {cc[0]}.{cc[1]})")
     except Exception as e:
         print(f"GPU Error: {e}")
 
 # --- 2. PATHS & CONFIG ---
 IMG_SIZE = 512 
 EPOCHS = 60
+BATCH_SIZE = 8
 digital_path = r'E:\project\Guava (Psidium guajava) fruit digital and thermal Images\DIGITAL PHOTOS'
 thermal_path = r'E:\project\Guava (Psidium guajava) fruit digital and thermal Images\THERMAL IMAGES'
 
-# --- 3. THE "EXPERT" DATA GENERATOR ---
-class GuavaDataGenerator(tf.keras.utils.Sequence):
-    def __init__(self, d_files, t_files, augment=True):
-        self.d_files = d_files
-        self.t_files = t_files
-        self.augment = augment
+# --- 3. THE "EXPERT" DATA PIPELINE ---
+# tf.data decodes, resizes and augments on parallel CPU threads and prefetches
+# the next batch while the GPU trains on the current one.
+def label_for(path):
+    # Labeling Logic (Assumes filenames contain ripeness state)
+    name = path.lower()
+    if 'guava' in name:
+        # Higher precision mapping
+        rip = 0.10 if 'immature' in name else 0.90 if 'mature' in name else 0.50
+        return rip, 1.0
+    return 0.0, 0.0
+
+def load_gray(path):
+    # Read as Grayscale to emphasize texture over color noise
+    img = tf.io.decode_image(tf.io.read_file(path), channels=1, expand_animations=False)
+    # Area averaging whenever either axis shrinks; bilinear only when enlarging
+    img = tf.cond(
+        tf.reduce_any(tf.shape(img)[:2] > IMG_SIZE),
+        lambda: tf.image.resize(img, (IMG_SIZE, IMG_SIZE), method='area'),
+        lambda: tf.image.resize(img, (IMG_SIZE, IMG_SIZE)),
+    )
+    return img / 255.0
 
-    def __len__(self):
-        return len(self.d_files)
+def make_dataset(d_files, t_files, augment=True):
+    labels = [label_for(p) for p in d_files]
+    rip = [r for r, _ in labels]
+    is_guava = [g for _, g in labels]
 
-    def __getitem__(self, idx):
-        # Read as Grayscale to emphasize texture over color noise
-        img_d = cv2.imread(self.d_files[idx], 0)
-        img_t = cv2.imread(self.t_files[idx], 0)
-        img_d = cv2.resize(img_d, (IMG_SIZE, IMG_SIZE))
-        img_t = cv2.resize(img_t, (IMG_SIZE, IMG_SIZE))
+    def load_pair(d_path, t_path, rip, is_guava):
+        img_d = load_gray(d_path)
+        img_t = load_gray(t_path)
 
         # Strategic Augmentation for "Unseen" Accuracy
-        if self.augment and np.random.random() > 0.5:
-            flip = np.random.choice([-1, 0, 1])
-            img_d = cv2.flip(img_d, flip)
-            img_t = cv2.flip(img_t, flip)
-
-        X = np.expand_dims(img_d, axis=(0, -1)).astype('float32') / 255.0
-        Y_thermal = np.expand_dims(img_t, axis=(0, -1)).astype('float32') / 255.0
-        
-        # Labeling Logic (Assumes filenames contain ripeness state)
-        name = self.d_files[idx].lower()
-        if 'guava' in name:
-            is_guava = 1.0
-            # Higher precision mapping
-            rip = 0.10 if 'immature' in name else 0.90 if 'mature' in name else 0.50
-        else:
-            is_guava = 0.0
-            rip = 0.0
-        
-        return X, {
-            'thermal_out': Y_thermal, 
-            'ripeness_out': np.array([[rip]], dtype='float32'),
-            'guava_guard': np.array([[is_guava]], dtype='float32')
+        # Digital + thermal are stacked so both receive the exact same flip
+        if augment:
+            pair = tf.concat([img_d, img_t], axis=-1)
+            pair = tf.image.random_flip_left_right(pair)
+            pair = tf.image.random_flip_up_down(pair)
+            img_d, img_t = pair[..., :1], pair[..., 1:]
+
+        return img_d, {
+            'thermal_out': img_t,
+            'ripeness_out': tf.reshape(rip, [1]),
+            'guava_guard': tf.reshape(is_guava, [1])
         }
 
+    ds = tf.data.Dataset.from_tensor_slices(
+        (d_files, t_files, tf.constant(rip, tf.float32), tf.constant(is_guava, tf.float32))
+    )
+    ds = ds.shuffle(len(d_files), reshuffle_each_iteration=True)
+    ds = ds.map(load_pair, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
 # --- 4. THE MULTI-TASK U-NET ARCHITECTURE ---
 def build_expert_model():
     inputs = layers.Input(shape=[IMG_SIZE, IMG_SIZE, 1])
 
     # Encoder: Extracting Texture and Shape
+    # c1 stays a dense Conv2D: with a single input channel a separable conv
+    # degenerates to one 3x3 filter, and the dense layer is already cheap (1->32).
+    # Multi-channel 3x3 convs are depthwise-separable (depthwise 3x3 + 1x1),
+    # ~8x fewer MACs on these large feature maps.
     c1 = layers.Conv2D(32, 3, activation='relu', padding='same')(inputs)
     p1 = layers.MaxPooling2D((2, 2))(c1) # 256x256
 
-    c2 = layers.Conv2D(64, 3, activation='relu', padding='same')(p1)
+    c2 = layers.SeparableConv2D(64, 3, activation='relu', padding='same')(p1)
     p2 = layers.MaxPooling2D((2, 2))(c2) # 128x128
 
     # --- Head 1: Guava Guard (Classification) ---
@@ -86,7 +111,7 @@ def build_expert_model():
     # These skip connections ensure the thermal image looks sharp, not blurry
     u1 = layers.Conv2DTranspose(64, 2, strides=2, padding='same')(p2)
     u1 = layers.concatenate([u1, c2]) 
-    u1 = layers.Conv2D(64, 3, activation='relu', padding='same')(u1)
+    u1 = layers.SeparableConv2D(64, 3, activation='relu', padding='same')(u1)
 
     u2 = layers.Conv2DTranspose(32, 2, strides=2, padding='same')(u1)
     u2 = layers.concatenate([u2, c1]) 
@@ -103,13 +128,51 @@ def build_expert_model():
 
 # --- 5. TRAINING ---
 if __name__ == '__main__':
-    def get_files(path):
-        return sorted([os.path.join(r, f) for r, _, fs in os.walk(path) for f in fs if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-
-    d_list = get_files(digital_path)
-    t_list = get_files(thermal_path)
-    
-    train_gen = GuavaDataGenerator(d_list, t_list)
+    def get_files(path, exts=('.png', '.jpg', '.jpeg')):
+        # os.scandir reads entry types from the directory listing itself,
+        # so no per-file stat() is issued (unlike os.walk on some platforms).
+        # Files are keyed by their path relative to `path` minus the extension,
+        # so 'mature/001.jpg' pairs with 'mature/001.png' but never 'immature/001'
+        files, pending = {}, [path]
+        while pending:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        pending.append(entry.path)
+                    elif entry.name.lower().endswith(exts):
+                        key = os.path.splitext(os.path.relpath(entry.path, path))[0].lower()
+                        files[key] = entry.path
+        return files
+
+    def by_stem(files):
+        # Re-key on the bare file name; a stem found in several folders is
+        # ambiguous, so it is left out rather than paired with the wrong image
+        stems = {}
+        for key, file_path in files.items():
+            stems.setdefault(os.path.basename(key), []).append(file_path)
+        return {stem: paths[0] for stem, paths in stems.items() if len(paths) == 1}
+
+    # Hash join digital <-> thermal on the shared key: a missing file only
+    # drops its own pair instead of shifting every pair after it
+    d_files = get_files(digital_path)
+    t_files = get_files(thermal_path)
+    d_total, t_total = len(d_files), len(t_files)
+    keys = d_files.keys() & t_files.keys()
+    if not keys and d_files and t_files:
+        # The trees are laid out differently (e.g. flat vs. per-class folders)
+        print("⚠️ No pairs by relative path; pairing digital/thermal images by file name")
+        d_files, t_files = by_stem(d_files), by_stem(t_files)
+        keys = d_files.keys() & t_files.keys()
+    keys = sorted(keys)
+    if len(keys) < max(d_total, t_total):
+        print(f"⚠️ Skipping {d_total - len(keys)} of {d_total} digital and "
+              f"{t_total - len(keys)} of {t_total} thermal images without a partner")
+    if not keys:
+        raise SystemExit("❌ No digital/thermal image pairs found")
+    d_list = [d_files[k] for k in keys]
+    t_list = [t_files[k] for k in keys]
+
+    train_ds = make_dataset(d_list, t_list)
 
     model = build_expert_model()
     model.compile(
@@ -123,5 +186,5 @@ if __name__ == '__main__':
         loss_weights={'thermal_out': 2.0, 'ripeness_out': 900.0, 'guava_guard': 300.0}
     )
 
-    model.fit(train_gen, epochs=EPOCHS)
+    model.fit(train_ds, epochs=EPOCHS)
     model.save("guava_perfect_expert1.h5")
\ No newline at end of file
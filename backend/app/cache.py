@@ -0,0 +1,65 @@
+"""
+app/cache.py
+============
+Short-lived in-memory store for rendered thermal images.
+
+/predict stores the encoded image here and returns a URL instead of embedding a
+base64 data URI in the JSON (base64 inflates the payload by a third and has
+to be built on the request path). The browser then fetches the image via
+GET /thermal/{id}, decoding it natively off the main JS thread.
+
+Entries expire after `ttl` seconds; the oldest entry is evicted once
+`maxsize` is reached. All access happens on the event loop, so no lock is
+needed.
+
+The store is per process: with several uvicorn workers, GET /thermal/{id}
+only finds the image if it reaches the worker that served /predict, so
+the app must run as a single worker or behind sticky routing.
+"""
+
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+DEFAULT_MAXSIZE = 256
+DEFAULT_TTL_S   = 60.0
+
+
+class ThermalCache:
+    """Bounded cache of encoded images keyed by random ids, with per-entry expiry."""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL_S):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def put(self, data: bytes, media_type: str) -> str:
+        """Store `data` with its media type and return its id."""
+        self._evict_expired()
+        while len(self._entries) >= self.maxsize:
+            self._entries.popitem(last=False)
+
+        key = uuid.uuid4().hex
+        self._entries[key] = (time.monotonic() + self.ttl, data, media_type)
+        return key
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Return (bytes, media type) stored under `key`, or None if unknown or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, data, media_type = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        return data, media_type
+
+    def _evict_expired(self) -> None:
+        # Entries are inserted in expiry order, so stop at the first live one
+        now = time.monotonic()
+        while self._entries:
+            key, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at >= now:
+                break
+            del self._entries[key]
@@ -0,0 +1,227 @@
+"""
+app/engines.py
+==============
+Alternative inference engines for the ripeness model.
+
+Each engine mimics the small slice of the Keras model API the backend
+relies on (`input_shape`, `predict()`, `summary()`), so the rest of the
+pipeline does not care which runtime produced the outputs.
+"""
+
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Output order of the Keras model (see assets/train.py::build_expert_model).
+# Runtimes that key outputs by name are mapped back to this order so
+# _parse_model_outputs() sees the same list a Keras model would return.
+OUTPUT_ORDER = ("thermal_out", "ripeness_out", "guava_guard")
+
+
+def _order_outputs(named: dict) -> list:
+    names = [n for n in OUTPUT_ORDER if n in named]
+    names += sorted(n for n in named if n not in OUTPUT_ORDER)
+    return [named[n] for n in names]
+
+
+class TFLiteModel:
+    """
+    Runs a `.tflite` model (e.g. the INT8 build from scripts/quantize.py).
+
+    Quantized inputs are handled transparently: float32 batches in [0, 1]
+    are mapped onto the input tensor's (scale, zero_point) before invoke.
+    The interpreter uses one thread per core unless `num_threads` is given.
+    """
+
+    def __init__(self, path: Path, num_threads: int = None):
+        import tensorflow as tf
+
+        self.path = Path(path)
+        self._interpreter = tf.lite.Interpreter(
+            model_path=str(self.path), num_threads=num_threads or os.cpu_count(),
+        )
+        self._interpreter.allocate_tensors()
+        self._runner = self._interpreter.get_signature_runner()
+
+        signature = next(iter(self._interpreter.get_signature_list().values()))
+        self._input_name = signature["inputs"][0]
+
+        details = self._interpreter.get_input_details()[0]
+        self._input_dtype = details["dtype"]
+        self._input_quant = details["quantization"]
+        self.input_shape = tuple(
+            None if d < 0 else int(d) for d in details["shape_signature"]
+        )
+
+    def predict(self, input_array: np.ndarray, verbose: int = 0) -> list:
+        if self._input_dtype != np.float32:
+            scale, zero_point = self._input_quant
+            info = np.iinfo(self._input_dtype)
+            input_array = np.clip(
+                np.round(input_array / scale + zero_point), info.min, info.max
+            ).astype(self._input_dtype)
+
+        named = self._runner(**{self._input_name: input_array})
+        return _order_outputs(named)
+
+    def summary(self, print_fn=print) -> None:
+        print_fn(f"TFLite model: {self.path}")
+        print_fn(f"  input  {self._input_name}: {self.input_shape} {np.dtype(self._input_dtype).name}")
+        for detail in self._interpreter.get_output_details():
+            print_fn(f"  output {detail['name']}: {tuple(int(d) for d in detail['shape_signature'])} "
+                     f"{np.dtype(detail['dtype']).name}")
+
+
+class SavedModel:
+    """
+    Runs a TensorFlow SavedModel through its `serving_default` signature.
+
+    Loading skips Keras' Python-side reconstruction of every layer, and the
+    signature is an already-traced concrete function, so the first request
+    does not pay for tracing either. With `jit_compile` (for GPUs), the
+    signature is additionally compiled by XLA, once per distinct batch size.
+    """
+
+    def __init__(self, path: Path, jit_compile: bool = False):
+        import tensorflow as tf
+
+        self.path = Path(path)
+        self._loaded = tf.saved_model.load(str(self.path))
+        self._signature = self._loaded.signatures["serving_default"]
+
+        _, specs = self._signature.structured_input_signature
+        self._input_name, spec = next(iter(specs.items()))
+        self.input_shape = tuple(spec.shape.as_list())
+
+        signature, input_name = self._signature, self._input_name
+        self._fn = tf.function(
+            lambda x: signature(**{input_name: x}), input_signature=[spec], jit_compile=jit_compile,
+        )
+
+    def predict(self, input_array: np.ndarray, verbose: int = 0) -> list:
+        named = self._fn(input_array)
+        return _order_outputs({name: out.numpy() for name, out in named.items()})
+
+    def summary(self, print_fn=print) -> None:
+        print_fn(f"SavedModel: {self.path}")
+        print_fn(f"  input  {self._input_name}: {self.input_shape}")
+        for name, spec in self._signature.structured_outputs.items():
+            print_fn(f"  output {name}: {tuple(spec.shape.as_list())} {spec.dtype.name}")
+
+
+class ONNXModel:
+    """
+    Runs an `.onnx` model through ONNX Runtime.
+
+    The session calls straight into ORT's SIMD kernels with no TensorFlow
+    dispatch in between. The CUDA provider is used when the installed
+    onnxruntime build has it, otherwise the CPU provider.
+    """
+
+    def __init__(self, path: Path, num_threads: int = None):
+        import onnxruntime as ort
+
+        self.path = Path(path)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or os.cpu_count() or 0
+        available = ort.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available]
+        self._session = ort.InferenceSession(str(self.path), sess_options=options, providers=providers)
+
+        node = self._session.get_inputs()[0]
+        self._input_name = node.name
+        self.input_shape = tuple(d if isinstance(d, int) else None for d in node.shape)
+        self._output_names = [o.name for o in self._session.get_outputs()]
+        # tf2onnx may suffix tensor names (e.g. "thermal_out/Sigmoid:0")
+        self._output_keys = [n.split(":")[0].split("/")[0] for n in self._output_names]
+
+    def predict(self, input_array: np.ndarray, verbose: int = 0) -> list:
+        outputs = self._session.run(self._output_names, {self._input_name: input_array})
+        return _order_outputs(dict(zip(self._output_keys, outputs)))
+
+    def summary(self, print_fn=print) -> None:
+        print_fn(f"ONNX model: {self.path} ({', '.join(self._session.get_providers())})")
+        print_fn(f"  input  {self._input_name}: {self.input_shape}")
+        for node in self._session.get_outputs():
+            print_fn(f"  output {node.name}: {tuple(node.shape)} {node.type}")
+
+
+def export_saved_model(h5_path: Path) -> Path:
+    """
+    Convert a Keras .h5 model to a SavedModel directory next to it.
+
+    The export is cached: it only reruns when the .h5 file is newer than
+    the existing SavedModel, so only the first start after a model update
+    pays for the Keras load. Each process exports into its own temp
+    directory and renames it into place, so concurrent uvicorn workers
+    never see (or load) a half-written export.
+    """
+    h5_path = Path(h5_path)
+    saved_dir = h5_path.with_name(f"{h5_path.stem}_savedmodel")
+    # saved_model.pb is written last, so it only exists for a complete export
+    graph_pb = saved_dir / "saved_model.pb"
+    if _is_fresh(graph_pb, h5_path):
+        return saved_dir
+
+    import keras
+
+    logger.info("Exporting '%s' to SavedModel at '%s' …", h5_path, saved_dir)
+    tmp_dir = saved_dir.with_name(f"{saved_dir.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    model = keras.models.load_model(str(h5_path), compile=False)
+    model.save(str(tmp_dir), save_format="tf")
+
+    # A directory cannot be renamed over a non-empty one: move a stale export
+    # aside first, unless another worker installed a fresh one meanwhile
+    if saved_dir.exists() and not _is_fresh(graph_pb, h5_path):
+        stale_dir = saved_dir.with_name(f"{saved_dir.name}.old-{os.getpid()}")
+        try:
+            os.replace(saved_dir, stale_dir)
+        except OSError:
+            pass  # another worker already moved it
+        shutil.rmtree(stale_dir, ignore_errors=True)
+    try:
+        os.replace(tmp_dir, saved_dir)
+    except OSError:
+        # Another worker's complete export won the race; use that one
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return saved_dir
+
+
+def export_onnx(h5_path: Path) -> Path:
+    """
+    Convert a Keras .h5 model to an .onnx file next to it (needs tf2onnx).
+
+    Cached (and safe across concurrent workers) the same way as
+    export_saved_model().
+    """
+    h5_path = Path(h5_path)
+    onnx_path = h5_path.with_suffix(".onnx")
+    if _is_fresh(onnx_path, h5_path):
+        return onnx_path
+
+    import keras
+    import tensorflow as tf
+    import tf2onnx
+
+    logger.info("Exporting '%s' to ONNX at '%s' …", h5_path, onnx_path)
+    model = keras.models.load_model(str(h5_path), compile=False)
+    spec = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="input"),)
+    model_proto, _ = tf2onnx.convert.from_keras(model, input_signature=spec)
+
+    # Write to a per-process file, then rename: a crash mid-write never leaves
+    # a truncated cache, and concurrent workers never share a temp file
+    tmp_path = onnx_path.with_name(f"{onnx_path.name}.tmp-{os.getpid()}")
+    tmp_path.write_bytes(model_proto.SerializeToString())
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+def _is_fresh(path: Path, source: Path) -> bool:
+    """True if `path` exists and is at least as new as `source`."""
+    return path.exists() and path.stat().st_mtime >= source.stat().st_mtime
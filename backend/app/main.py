@@ -12,14 +12,26 @@ from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.batching import InferenceBatcher
+from app.cache import ThermalCache
+from app.engines import ONNXModel, SavedModel, TFLiteModel, export_onnx, export_saved_model
 from app.gate import GuavaGate
 from app.models import HealthResponse
 from app.routes.predict import router as predict_router
-from app.utils import get_model_channels, get_model_input_size
+from app.utils import (
+    DEFAULT_DEVICE,
+    DEFAULT_THERMAL_FORMAT,
+    THERMAL_FORMATS,
+    build_infer_fn,
+    build_output_map,
+    get_model_channels,
+    get_model_input_size,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,14 +41,38 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Read by TensorFlow when it is first imported (lazily, during startup);
+# values already set in the environment or backend/.env take precedence
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+
 MODEL_PATH       = Path(os.getenv("MODEL_PATH",  "./model/model.h5"))
 LABELS_PATH      = Path(os.getenv("LABELS_PATH", "./model/labels.json"))
 GATE_THRESHOLD   = float(os.getenv("GATE_THRESHOLD", "0.5"))
 GATE_ENABLED     = os.getenv("GATE_ENABLED", "true").lower() == "true"
+GATE_STRIDE      = int(os.getenv("GATE_SUBSAMPLE_STRIDE", "4"))
+INFERENCE_DEVICE = os.getenv("INFERENCE_DEVICE", DEFAULT_DEVICE)
+INFERENCE_XLA    = os.getenv("INFERENCE_XLA", "auto").lower()  # auto | true | false
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "savedmodel").lower()  # .h5 only
+BATCH_MAX_SIZE   = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT   = float(os.getenv("BATCH_MAX_LATENCY_MS", "15"))
+THERMAL_TTL      = float(os.getenv("THERMAL_TTL_SECONDS", "60"))
+THERMAL_FORMAT   = os.getenv("THERMAL_FORMAT", DEFAULT_THERMAL_FORMAT).lower()
+INTRA_OP_THREADS = int(os.getenv("TF_NUM_INTRAOP_THREADS", "0"))  # 0 → one per core
+INTER_OP_THREADS = int(os.getenv("TF_NUM_INTEROP_THREADS", "1"))
 
 _cors_raw    = os.getenv("CORS_ORIGINS", "http://localhost:5173")
 CORS_ORIGINS = [o.strip() for o in _cors_raw.split(",")]
 
+INFERENCE_ENGINES = ("savedmodel", "onnx", "keras")
+
+
+def _load_keras(path: Path, jit_compile: bool):
+    """Load a .h5 model with Keras and wrap it in a traced inference function."""
+    import keras
+    model = keras.models.load_model(str(path), compile=False)
+    return model, build_infer_fn(model, jit_compile=jit_compile)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -45,24 +81,93 @@ async def lifespan(app: FastAPI):
     logger.info("=" * 60)
 
     model      = None
+    infer_fn   = None
+    output_map = None
     labels     = None
     input_size = (224, 224)
     channels   = 3
 
+    # ── Size TensorFlow's thread pools ────────────────────────────────────────
+    # One batch runs at a time, so a single inter-op pool avoids two pools
+    # competing for the same cores; must happen before the first TF op
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(INTRA_OP_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(INTER_OP_THREADS)
+    except RuntimeError as exc:
+        logger.warning("Could not set TensorFlow thread pools: %s", exc)
+
+    # ── Decide on XLA ─────────────────────────────────────────────────────────
+    # XLA pays off on GPU only: on CPU the compiled U-Net runs ~10x slower and
+    # bypasses the oneDNN kernels, so "auto" enables it only for a visible GPU
+    if INFERENCE_XLA == "auto":
+        on_cpu = INFERENCE_DEVICE is not None and "CPU" in INFERENCE_DEVICE.upper()
+        xla = not on_cpu and bool(tf.config.list_physical_devices("GPU"))
+    else:
+        xla = INFERENCE_XLA == "true"
+
+    # ── Runtime for .h5 models ────────────────────────────────────────────────
+    engine = INFERENCE_ENGINE
+    if engine not in INFERENCE_ENGINES:
+        logger.warning("Unknown INFERENCE_ENGINE '%s' (expected one of %s); using 'savedmodel'.",
+                       engine, ", ".join(INFERENCE_ENGINES))
+        engine = "savedmodel"
+
     # ── Load ripeness model ───────────────────────────────────────────────────
     if not MODEL_PATH.exists():
         logger.warning("Model not found at '%s'. /predict will return 503.", MODEL_PATH)
     else:
         logger.info("Loading model from '%s' …", MODEL_PATH)
         try:
-            import keras
-            model      = keras.models.load_model(str(MODEL_PATH), compile=False)
+            if MODEL_PATH.suffix == ".tflite":
+                model    = TFLiteModel(MODEL_PATH, num_threads=INTRA_OP_THREADS)
+                infer_fn = model.predict
+            elif MODEL_PATH.suffix == ".onnx":
+                model    = ONNXModel(MODEL_PATH, num_threads=INTRA_OP_THREADS)
+                infer_fn = model.predict
+            elif MODEL_PATH.is_dir():
+                model    = SavedModel(MODEL_PATH, jit_compile=xla)
+                infer_fn = model.predict
+            elif engine == "keras":
+                model, infer_fn = _load_keras(MODEL_PATH, jit_compile=xla)
+            else:
+                try:
+                    if engine == "onnx":
+                        model = ONNXModel(export_onnx(MODEL_PATH), num_threads=INTRA_OP_THREADS)
+                    else:
+                        model = SavedModel(export_saved_model(MODEL_PATH), jit_compile=xla)
+                    infer_fn = model.predict
+                except Exception as exc:
+                    logger.warning("%s export failed (%s); serving the .h5 via Keras.", engine, exc)
+                    model, infer_fn = _load_keras(MODEL_PATH, jit_compile=xla)
             input_size = get_model_input_size(model)
             channels   = get_model_channels(model)
             logger.info("Model loaded. Input: %s  Channels: %d", input_size, channels)
             model.summary(print_fn=logger.info)
         except Exception as exc:
             logger.error("Failed to load model: %s", exc)
+            model = infer_fn = None
+            input_size, channels = (224, 224), 3
+
+    # ── Warm up the model ─────────────────────────────────────────────────────
+    if infer_fn is not None:
+        try:
+            # Traces/compiles the batch-1 graph and fixes which output is
+            # which, so requests index outputs directly
+            warmup     = np.zeros((BATCH_MAX_SIZE, *input_size, channels), dtype=np.float32)
+            output_map = build_output_map(infer_fn(warmup[:1]))
+
+            # XLA compiles once per batch size: do every size the batcher can
+            # form now, rather than while the first real batch of it waits
+            if xla:
+                for size in range(2, BATCH_MAX_SIZE + 1):
+                    infer_fn(warmup[:size])
+                logger.info("XLA warm-up done for batch sizes 1-%d", BATCH_MAX_SIZE)
+        except Exception as exc:
+            # A model that cannot run is not loaded: /predict answers 503
+            logger.error("Model warm-up failed: %s", exc)
+            model = infer_fn = output_map = None
+            input_size, channels = (224, 224), 3
 
     # ── Load labels ───────────────────────────────────────────────────────────
     if LABELS_PATH.exists():
@@ -76,22 +181,54 @@ async def lifespan(app: FastAPI):
         logger.info("No labels.json found — using class indices.")
 
     # ── Set up guava gate (model-based, no CLIP needed) ───────────────────────
-    gate = GuavaGate(threshold=GATE_THRESHOLD, enabled=GATE_ENABLED)
+    gate = GuavaGate(
+        threshold=GATE_THRESHOLD,
+        enabled=GATE_ENABLED,
+        subsample_stride=GATE_STRIDE,
+    )
+
+    # ── Start the micro-batching queue ────────────────────────────────────────
+    batcher = None
+    if infer_fn is not None:
+        batcher = InferenceBatcher(
+            infer_fn,
+            device=INFERENCE_DEVICE,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_latency_ms=BATCH_MAX_WAIT,
+            output_map=output_map,
+        )
+        batcher.start()
+
+    # ── Thermal output format ─────────────────────────────────────────────────
+    thermal_format = THERMAL_FORMAT
+    if thermal_format not in THERMAL_FORMATS:
+        logger.warning("Unknown THERMAL_FORMAT '%s'; using '%s'.", thermal_format, DEFAULT_THERMAL_FORMAT)
+        thermal_format = DEFAULT_THERMAL_FORMAT
 
     # ── Store on app state ────────────────────────────────────────────────────
-    app.state.model      = model
-    app.state.labels     = labels
-    app.state.input_size = input_size
-    app.state.channels   = channels
-    app.state.gate       = gate
-
-    logger.info("Gate enabled: %s | Threshold: %.2f | CORS: %s",
-                GATE_ENABLED, GATE_THRESHOLD, CORS_ORIGINS)
+    app.state.model            = model
+    app.state.labels           = labels
+    app.state.label_list       = tuple(labels) if labels else ()
+    app.state.input_shape_list = list(model.input_shape) if model is not None else None
+    app.state.input_size       = input_size
+    app.state.channels         = channels
+    app.state.gate             = gate
+    app.state.device           = INFERENCE_DEVICE
+    app.state.batcher          = batcher
+    app.state.output_map       = output_map
+    app.state.thermal_cache    = ThermalCache(ttl=THERMAL_TTL)
+    app.state.thermal_format   = thermal_format
+
+    logger.info("Gate enabled: %s | Threshold: %.2f | Device: %s | XLA: %s | Threads: %s/%d | CORS: %s",
+                GATE_ENABLED, GATE_THRESHOLD, INFERENCE_DEVICE or "auto", xla,
+                INTRA_OP_THREADS or "auto", INTER_OP_THREADS, CORS_ORIGINS)
     logger.info("=" * 60)
 
     yield
 
     logger.info("Shutting down …")
+    if batcher is not None:
+        await batcher.stop()
 
 
 app = FastAPI(
@@ -124,16 +261,14 @@ async def root():
 
 @app.get("/health", response_model=HealthResponse, tags=["Info"])
 async def health():
-    model  = app.state.model
-    loaded = model is not None
-    shape  = list(model.input_shape) if loaded else None
+    loaded = app.state.model is not None
     return HealthResponse(
         status="ok",
         model_loaded=loaded,
         gate_available=app.state.gate.available,
         gate_enabled=app.state.gate.enabled,
         gate_threshold=app.state.gate.threshold,
-        model_input_shape=shape,
+        model_input_shape=app.state.input_shape_list,
         labels_loaded=app.state.labels is not None,
         message=None if loaded else f"Place model.h5 at '{MODEL_PATH}' and restart.",
     )
\ No newline at end of file
@@ -20,7 +20,7 @@ class PredictionResponse(BaseModel):
     success: bool
     is_guava: bool = True
     predictions: List[PredictionItem]
-    thermal_image: Optional[str] = None
+    thermal_url: Optional[str] = None
     meta: PredictionMeta
 
 
@@ -4,14 +4,14 @@ import logging
 from typing import Any
 
 from fastapi import APIRouter, File, HTTPException, Request, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
 from app.utils import (
+    THERMAL_FORMATS,
     build_predictions,
     decode_image,
     preprocess_image,
     render_thermal_image,
-    run_inference,
 )
 
 logger = logging.getLogger(__name__)
@@ -51,51 +51,54 @@ async def predict(
         })
 
     # ── Read bytes ────────────────────────────────────────────────────────────
+    too_large = HTTPException(status_code=400, detail={
+        "success": False,
+        "error": f"File too large (max {MAX_UPLOAD_BYTES // (1024*1024)} MB)",
+    })
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise too_large  # reject before reading the spooled body
+
     file_bytes = await file.read()
     if not file_bytes:
         raise HTTPException(status_code=400, detail={
             "success": False, "error": "Empty file",
         })
     if len(file_bytes) > MAX_UPLOAD_BYTES:
-        raise HTTPException(status_code=400, detail={
-            "success": False,
-            "error": f"File too large (max {MAX_UPLOAD_BYTES // (1024*1024)} MB)",
-        })
+        raise too_large
 
     # ── Decode image ──────────────────────────────────────────────────────────
     try:
-        img_rgb = decode_image(file_bytes)
+        img_bgr = decode_image(file_bytes, state.input_size)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail={
             "success": False, "error": "Cannot decode image", "detail": str(exc),
         })
 
     # ── Color-based guava gate (HSV spectrum check) ───────────────────────────
-    is_guava, match_pct, gate_message = state.gate.check_color(img_rgb)
+    is_guava, match_pct, gate_message = state.gate.check_color(img_bgr)
+    gate_confidence = round(match_pct * 0.01, 4)  # normalise to 0-1 for UI
 
     if not is_guava:
         logger.info("Color gate rejected image: %s", gate_message)
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "success": True,
             "is_guava": False,
-            "message": gate_message,
-            "gate_confidence": round(match_pct / 100.0, 4),  # normalise to 0-1 for UI
             "predictions": [],
-            "thermal_image": None,
+            "thermal_url": None,
             "meta": {
-                "model_input_shape": list(state.model.input_shape),
+                "model_input_shape": state.input_shape_list,
                 "processing_time_ms": 0,
-                "gate_confidence": round(match_pct / 100.0, 4),
+                "gate_confidence": gate_confidence,
                 "gate_message": gate_message,
             },
         })
 
     # ── Preprocess ────────────────────────────────────────────────────────────
-    input_array = preprocess_image(img_rgb, state.input_size, channels=state.channels)
+    input_array = preprocess_image(img_bgr, state.input_size, channels=state.channels)
 
-    # ── Run inference ─────────────────────────────────────────────────────────
+    # ── Run inference (batched with concurrent requests) ──────────────────────
     try:
-        outputs, elapsed_ms = run_inference(state.model, input_array)
+        outputs, elapsed_ms = await state.batcher.submit(input_array)
     except Exception as exc:
         logger.exception("Inference error")
         raise HTTPException(status_code=500, detail={
@@ -103,26 +106,49 @@ async def predict(
         })
 
     # ── Build ripeness predictions ────────────────────────────────────────────
-    predictions = build_predictions(outputs["ripeness"], state.labels)
+    predictions = build_predictions(outputs["ripeness"], state.label_list)
 
     # ── Render thermal image ──────────────────────────────────────────────────
-    thermal_b64 = None
+    thermal_url = None
     if outputs["thermal"] is not None:
         try:
-            thermal_b64 = render_thermal_image(outputs["thermal"])
+            fmt         = state.thermal_format
+            thermal_id  = state.thermal_cache.put(
+                render_thermal_image(outputs["thermal"], fmt), THERMAL_FORMATS[fmt][1],
+            )
+            thermal_url = f"/thermal/{thermal_id}"
             logger.info("Thermal image rendered successfully")
         except Exception as exc:
             logger.warning("Could not render thermal image: %s", exc)
 
-    return JSONResponse(content={
+    return ORJSONResponse(content={
         "success": True,
         "is_guava": True,
         "predictions": predictions,
-        "thermal_image": thermal_b64,
+        "thermal_url": thermal_url,
         "meta": {
-            "model_input_shape": list(state.model.input_shape),
+            "model_input_shape": state.input_shape_list,
             "processing_time_ms": round(elapsed_ms, 2),
-            "gate_confidence": round(match_pct / 100.0, 4),
+            "gate_confidence": gate_confidence,
             "gate_message": gate_message,
         },
-    })
\ No newline at end of file
+    })
+
+
+@router.get("/thermal/{thermal_id}", summary="Fetch a rendered thermal heatmap")
+async def thermal(request: Request, thermal_id: str, download: bool = False) -> Response:
+    entry = request.app.state.thermal_cache.get(thermal_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail={
+            "success": False,
+            "error": "Thermal image not found",
+            "detail": "It may have expired — run /predict again.",
+        })
+    data, media_type = entry
+    headers = None
+    if download:
+        # Browsers ignore <a download> on cross-origin links (UI and API run on
+        # different ports), so ask for a file save via the response instead
+        ext = media_type.split("/")[-1].replace("jpeg", "jpg")
+        headers = {"Content-Disposition": f'attachment; filename="thermal.{ext}"'}
+    return Response(content=data, media_type=media_type, headers=headers)
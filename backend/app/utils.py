@@ -1,16 +1,27 @@
 """Image preprocessing utilities for the fruit ripeness API."""
 
-import base64
+import contextlib
 import logging
+import threading
 import time
-from typing import Optional, Tuple
+from io import BytesIO
+from typing import Callable, Optional, Tuple
 
 import cv2
 import numpy as np
 
+try:
+    from PIL import Image
+except ImportError:  # Pillow only backs the fallback decoder and JPEG header sniffing
+    Image = None
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_IMG_SIZE: Tuple[int, int] = (224, 224)
+DEFAULT_DEVICE: Optional[str] = None  # None → let TensorFlow place ops (GPU if present)
+
+# Per-thread scratch buffers for thermal rendering, reused across requests
+_local = threading.local()
 
 
 # ── Model shape helpers ───────────────────────────────────────────────────────
@@ -46,26 +57,75 @@ def get_model_channels(model) -> int:
 
 # ── Image decode ──────────────────────────────────────────────────────────────
 
-def decode_image(file_bytes: bytes) -> np.ndarray:
-    """Decode raw bytes to RGB uint8 numpy array. OpenCV first, Pillow fallback."""
+# libjpeg can emit 1/8, 1/4 or 1/2 scale output directly from the IDCT
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def _decode_flag(file_bytes: bytes, target_size: Optional[Tuple[int, int]]) -> int:
+    """
+    Pick the cheapest cv2.imdecode flag that still yields >= target_size pixels.
+
+    Only JPEGs benefit: libjpeg downscales while decoding, skipping most of
+    the IDCT work on large phone photos. Other formats would be decoded at
+    full size and then resized, so they always use IMREAD_COLOR.
+    """
+    if target_size is None or Image is None or file_bytes[:3] != b"\xff\xd8\xff":
+        return cv2.IMREAD_COLOR
     try:
-        arr = np.frombuffer(file_bytes, dtype=np.uint8)
-        img_bgr = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        if img_bgr is None:
-            raise ValueError("cv2.imdecode returned None")
-        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-        logger.info("Image decoded via OpenCV, shape=%s", img_rgb.shape)
-        return img_rgb
-    except Exception as cv_exc:
-        logger.warning("OpenCV decode failed (%s); trying Pillow fallback.", cv_exc)
+        with Image.open(BytesIO(file_bytes)) as header:  # parses the header only
+            width, height = header.size
+    except Exception:
+        return cv2.IMREAD_COLOR
+
+    h, w = target_size
+    for factor, flag in _REDUCED_DECODE_FLAGS:
+        if width // factor >= w and height // factor >= h:
+            logger.info("Decoding %dx%d JPEG at 1/%d scale", width, height, factor)
+            return flag
+    return cv2.IMREAD_COLOR
 
+
+def decode_image(
+    file_bytes: bytes,
+    target_size: Optional[Tuple[int, int]] = None,
+) -> np.ndarray:
+    """
+    Decode raw bytes to a BGR uint8 numpy array. OpenCV first, Pillow fallback.
+
+    BGR is OpenCV's native order, so the decoded image is used as-is; the
+    swap to the model's RGB order happens on the (much smaller) resized
+    image in preprocess_image().
+
+    With `target_size` (H, W), large JPEGs are decoded at a reduced scale
+    that is still at least that big.
+    """
+    arr = np.frombuffer(file_bytes, dtype=np.uint8)
+    try:
+        img_bgr = cv2.imdecode(arr, _decode_flag(file_bytes, target_size))
+    except cv2.error as cv_exc:  # e.g. a header claiming more than CV_IO_MAX_IMAGE_PIXELS
+        logger.warning("OpenCV rejected the image (%s); trying Pillow fallback.", cv_exc.err)
+        return _decode_with_pillow(file_bytes)
+    if img_bgr is None:
+        logger.warning("OpenCV could not decode the image; trying Pillow fallback.")
+        return _decode_with_pillow(file_bytes)
+
+    logger.info("Image decoded via OpenCV, shape=%s", img_bgr.shape)
+    return img_bgr
+
+
+def _decode_with_pillow(file_bytes: bytes) -> np.ndarray:
+    """Decode bytes OpenCV rejected via Pillow; raises ValueError if that fails too."""
+    if Image is None:
+        raise ValueError("Failed to decode image: unsupported format and Pillow is not installed")
     try:
-        from io import BytesIO
-        from PIL import Image
         pil_img = Image.open(BytesIO(file_bytes)).convert("RGB")
-        img_rgb = np.array(pil_img, dtype=np.uint8)
-        logger.info("Image decoded via Pillow, shape=%s", img_rgb.shape)
-        return img_rgb
+        img_bgr = cv2.cvtColor(np.asarray(pil_img, dtype=np.uint8), cv2.COLOR_RGB2BGR)
+        logger.info("Image decoded via Pillow, shape=%s", img_bgr.shape)
+        return img_bgr
     except Exception as pil_exc:
         raise ValueError(f"Failed to decode image: {pil_exc}")
 
@@ -73,33 +133,92 @@ def decode_image(file_bytes: bytes) -> np.ndarray:
 # ── Preprocessing ─────────────────────────────────────────────────────────────
 
 def preprocess_image(
-    img_rgb: np.ndarray,
+    img_bgr: np.ndarray,
     target_size: Tuple[int, int],
     channels: int = 3,
 ) -> np.ndarray:
-    """Resize + normalise to (1, H, W, C) float32 in [0, 1]."""
+    """
+    Resize a BGR image to a (1, H, W, C) uint8 batch row (RGB or grayscale).
+
+    Scaling to float32 [0, 1] is deferred to normalize_into(), which the
+    batcher runs straight into its persistent batch buffer, so no request
+    allocates a float copy of its input.
+    """
     h, w = target_size
-    if channels == 1:
-        img_gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
-        img_resized = cv2.resize(img_gray, (w, h), interpolation=cv2.INTER_AREA)
-        img_float = img_resized.astype(np.float32) / 255.0
-        img_batch = np.expand_dims(img_float, axis=0)
-        img_batch = np.expand_dims(img_batch, axis=-1)
+    src = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY) if channels == 1 else img_bgr
+
+    # Area averaging is the right filter (and SIMD-fast) for shrinking camera
+    # photos; it degrades to nearest-neighbour when enlarging, so use bilinear only
+    # when neither axis shrinks (a wide photo may shrink in width alone)
+    shrinking = src.shape[0] > h or src.shape[1] > w
+    interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR
+    img_batch = np.empty((1, h, w, channels), dtype=np.uint8)
+    row = img_batch[0].reshape((h, w) + src.shape[2:])
+    if channels == 3:
+        # Channel swap on the resized image only, not the full decoded photo
+        cv2.cvtColor(cv2.resize(src, (w, h), interpolation=interpolation), cv2.COLOR_BGR2RGB, dst=row)
     else:
-        img_resized = cv2.resize(img_rgb, (w, h), interpolation=cv2.INTER_AREA)
-        img_float = img_resized.astype(np.float32) / 255.0
-        img_batch = np.expand_dims(img_float, axis=0)
+        cv2.resize(src, (w, h), dst=row, interpolation=interpolation)
 
     logger.info("Preprocessed to shape=%s (channels=%d)", img_batch.shape, channels)
     return img_batch
 
 
+# uint8 → float32 [0, 1], computed as float32 i / 255 exactly like training's
+# `img / 255.0` (multiplying by the reciprocal is off by an ulp for half the values)
+_NORMALIZE_LUT = np.arange(256, dtype=np.float32) / np.float32(255.0)
+
+
+def normalize_into(src: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Scale uint8 `src` to float32 [0, 1] in one LUT pass, writing into `out`."""
+    return cv2.LUT(src, _NORMALIZE_LUT, dst=out)
+
+
 # ── Inference ─────────────────────────────────────────────────────────────────
 
-def run_inference(model, input_array: np.ndarray) -> Tuple[dict, float]:
+def build_infer_fn(model, jit_compile: bool = False) -> Callable[[np.ndarray], list]:
+    """
+    Wrap a Keras model in a traced graph function returning a list of ndarrays.
+
+    Each call then runs the compiled graph directly instead of going through
+    model.predict(), which rebuilds a tf.data pipeline and callback stack on
+    every call — pure overhead for a single small batch.
+
+    The function is traced once, here, for the model's (B, H, W, C) float32
+    input; only the batch axis is left dynamic so micro-batches of any size
+    reuse the same graph and no request ever triggers a retrace.
+
+    With `jit_compile`, XLA fuses the graph's ops into fewer kernels. That
+    pays off on GPU only (on CPU it is far slower than the oneDNN kernels),
+    and it compiles once per distinct batch size.
+    """
+    import tensorflow as tf
+
+    spec  = tf.TensorSpec([None, *model.input_shape[1:]], tf.float32)
+    infer = tf.function(
+        lambda x: model(x, training=False), input_signature=[spec], jit_compile=jit_compile,
+    ).get_concrete_function()
+
+    def run(input_array: np.ndarray) -> list:
+        return [out.numpy() for out in tf.nest.flatten(infer(input_array))]
+
+    return run
+
+
+def run_inference(
+    infer_fn: Callable[[np.ndarray], list],
+    input_array: np.ndarray,
+    device: Optional[str] = DEFAULT_DEVICE,
+    output_map: Optional[dict] = None,
+) -> Tuple[dict, float]:
     """
     Run model inference and return parsed outputs dict + elapsed ms.
 
+    `infer_fn` comes from build_infer_fn() or an engine's predict().
+    `device` optionally pins inference to a TensorFlow device, e.g. "/CPU:0".
+    `output_map` is the build_output_map() result computed once at startup;
+    without it the map is rebuilt from this call's outputs.
+
     Your model has 3 outputs:
         thermal_out   (None, 512, 512, 1)  — spatial heatmap
         ripeness_out  (None, 1)            — sigmoid ripeness probability
@@ -110,11 +229,11 @@ def run_inference(model, input_array: np.ndarray) -> Tuple[dict, float]:
     import tensorflow as tf
 
     start = time.perf_counter()
-    with tf.device("/CPU:0"):
-        raw = model.predict(input_array, verbose=0)
+    with tf.device(device) if device else contextlib.nullcontext():
+        raw = infer_fn(input_array)
     elapsed_ms = (time.perf_counter() - start) * 1000.0
 
-    outputs = _parse_model_outputs(raw)
+    outputs = _parse_model_outputs(raw, output_map or build_output_map(raw))
     logger.info(
         "Inference: %.1f ms | ripeness=%s | thermal=%s | guava_guard=%s",
         elapsed_ms,
@@ -125,9 +244,9 @@ def run_inference(model, input_array: np.ndarray) -> Tuple[dict, float]:
     return outputs, elapsed_ms
 
 
-def _parse_model_outputs(raw) -> dict:
+def build_output_map(raw: list) -> dict:
     """
-    Split multi-output model results into named outputs.
+    Work out which model output is which, from one inference result.
 
     Model output order (from model.summary()):
         index 0 — thermal_out   shape (1, 512, 512, 1)  → spatial / 4-D
@@ -136,93 +255,102 @@ def _parse_model_outputs(raw) -> dict:
 
     Strategy:
         - 4-D outputs  → thermal candidate (pick largest)
-        - 2-D outputs  → classification candidates, sorted by original index
+        - 1/2-D outputs → classification candidates, in original index order
           first  classification output = ripeness
           second classification output = guava_guard
+
+    Returns {"thermal": i, "ripeness": j, "guava_guard": k}, None for
+    outputs the model lacks. The order is fixed per model, so this runs
+    once at startup rather than per request.
     """
-    result = {"ripeness": None, "thermal": None, "guava_guard": None, "raw": raw}
-
-    # Single output model
-    if not isinstance(raw, list):
-        arr = raw if isinstance(raw, np.ndarray) else np.array(raw, dtype=np.float32)
-        result["ripeness"] = arr
-        return result
-
-    spatial_candidates        = []
-    classification_candidates = []
-
-    for i, arr in enumerate(raw):
-        if not isinstance(arr, np.ndarray):
-            arr = np.array(arr, dtype=np.float32)
-        if arr.ndim == 4:
-            spatial_candidates.append((i, arr))
-        elif arr.ndim == 2:
-            classification_candidates.append((i, arr))
-        elif arr.ndim == 1:
-            classification_candidates.append((i, arr.reshape(1, -1)))
-
-    # Thermal — largest spatial output
-    if spatial_candidates:
-        spatial_candidates.sort(key=lambda x: x[1].size, reverse=True)
-        result["thermal"] = spatial_candidates[0][1]
-        logger.info("Thermal output: index=%d shape=%s", spatial_candidates[0][0], spatial_candidates[0][1].shape)
-
-    # Classification outputs — preserve original model order
-    classification_candidates.sort(key=lambda x: x[0])
-
-    if len(classification_candidates) >= 1:
-        result["ripeness"]    = classification_candidates[0][1]
-        logger.info("Ripeness output: index=%d shape=%s", classification_candidates[0][0], classification_candidates[0][1].shape)
-    if len(classification_candidates) >= 2:
-        result["guava_guard"] = classification_candidates[1][1]
-        logger.info("Guava guard output: index=%d shape=%s value=%.4f",
-                    classification_candidates[1][0],
-                    classification_candidates[1][1].shape,
-                    float(classification_candidates[1][1].flatten()[0]))
+    # Every engine hands back ndarrays, so requests never need to coerce them
+    assert all(isinstance(arr, np.ndarray) for arr in raw), "model outputs must be ndarrays"
+
+    spatial        = [i for i, arr in enumerate(raw) if arr.ndim == 4]
+    classification = [i for i, arr in enumerate(raw) if arr.ndim in (1, 2)]
 
+    output_map = {
+        "thermal":     max(spatial, key=lambda i: raw[i].size) if spatial else None,
+        "ripeness":    classification[0] if len(classification) >= 1 else None,
+        "guava_guard": classification[1] if len(classification) >= 2 else None,
+    }
+    logger.info("Model output indices: %s", output_map)
+    return output_map
+
+
+def _parse_model_outputs(raw: list, output_map: dict) -> dict:
+    """Split multi-output model results into named outputs via `output_map`."""
+    result = {name: None if i is None else raw[i] for name, i in output_map.items()}
+    result["raw"] = raw
     return result
 
 
 # ── Thermal image rendering ───────────────────────────────────────────────────
 
-def render_thermal_image(thermal_array: np.ndarray) -> str:
+# Thermal encoders: format → (extension, media type, cv2.imencode params).
+# The heatmap is a visual overlay, so lossy is fine: JPEG encodes ~10x faster
+# than PNG and WebP is the smallest on the wire (but slower to encode).
+THERMAL_FORMATS = {
+    "jpeg": (".jpg",  "image/jpeg", [cv2.IMWRITE_JPEG_QUALITY, 85]),
+    "webp": (".webp", "image/webp", [cv2.IMWRITE_WEBP_QUALITY, 85]),
+    "png":  (".png",  "image/png",  []),
+}
+DEFAULT_THERMAL_FORMAT = "jpeg"
+
+
+def render_thermal_image(thermal_array: np.ndarray, fmt: str = DEFAULT_THERMAL_FORMAT) -> bytes:
     """
-    Convert raw thermal model output to a colourised PNG base64 data URI.
+    Convert raw thermal model output to colourised image bytes.
 
     thermal_array: (1, H, W, 1) values in [0, 1]
-    Returns: "data:image/png;base64,..."
+    fmt:           key of THERMAL_FORMATS
+    Returns: encoded bytes (served via GET /thermal/{id})
     """
     arr = thermal_array.squeeze()
 
-    arr_min, arr_max = arr.min(), arr.max()
-    if arr_max - arr_min > 1e-6:
-        arr_norm = ((arr - arr_min) / (arr_max - arr_min) * 255).astype(np.uint8)
-    else:
-        arr_norm = np.zeros_like(arr, dtype=np.uint8)
+    # Fused min/max stretch to 0-255 (a flat map comes out all zeros)
+    arr_norm = cv2.normalize(
+        arr, _thermal_buffer("norm", arr.shape), 0, 255, cv2.NORM_MINMAX, cv2.CV_8U,
+    )
 
     # COLORMAP_INFERNO: dark purple=cool, orange=warm, yellow=hot
-    coloured = cv2.applyColorMap(arr_norm, cv2.COLORMAP_INFERNO)
+    coloured = cv2.applyColorMap(
+        arr_norm, cv2.COLORMAP_INFERNO, dst=_thermal_buffer("coloured", arr.shape + (3,)),
+    )
 
-    success, buffer = cv2.imencode(".png", coloured)
+    # OpenCV's default PNG settings (level 1 + RLE strategy) are already its
+    # fastest; passing IMWRITE_PNG_COMPRESSION explicitly is slower
+    ext, _, params = THERMAL_FORMATS[fmt]
+    success, buffer = cv2.imencode(ext, coloured, params)
     if not success:
-        raise RuntimeError("Failed to encode thermal image to PNG")
+        raise RuntimeError(f"Failed to encode thermal image to {fmt.upper()}")
+
+    return buffer.tobytes()
+
 
-    b64 = base64.b64encode(buffer.tobytes()).decode("utf-8")
-    return f"data:image/png;base64,{b64}"
+def _thermal_buffer(name: str, shape: tuple) -> np.ndarray:
+    """Per-thread uint8 render target, reallocated only when the shape changes."""
+    buf = getattr(_local, name, None)
+    if buf is None or buf.shape != shape:
+        buf = np.empty(shape, dtype=np.uint8)
+        setattr(_local, name, buf)
+    return buf
 
 
 # ── Prediction labels ─────────────────────────────────────────────────────────
 
 def build_predictions(
     ripeness_array: np.ndarray,
-    labels: Optional[list],
+    label_list: Tuple[str, ...] = (),
     top_k: int = 5,
 ) -> list:
-    """Convert ripeness sigmoid output to sorted [{label, confidence}] list."""
-    if not isinstance(ripeness_array, np.ndarray):
-        ripeness_array = np.array(ripeness_array, dtype=np.float32)
+    """
+    Convert ripeness sigmoid output to sorted [{label, confidence}] list.
 
-    probs = ripeness_array.flatten()
+    `label_list` is the tuple built once at startup (app.state.label_list);
+    classes beyond its length are named `class_{i}`.
+    """
+    probs = ripeness_array.ravel()
 
     # Single sigmoid → binary [not ripe, ripe]
     if len(probs) == 1:
@@ -230,16 +358,16 @@ def build_predictions(
         probs = np.array([1.0 - p, p], dtype=np.float32)
 
     num_classes = len(probs)
-    if labels is None:
-        label_list = [f"class_{i}" for i in range(num_classes)]
-    else:
-        label_list = list(labels)
-        if len(label_list) < num_classes:
-            label_list += [f"class_{i}" for i in range(len(label_list), num_classes)]
-
-    results = [
-        {"label": label_list[i], "confidence": float(probs[i])}
-        for i in range(num_classes)
-    ]
-    results.sort(key=lambda x: x["confidence"], reverse=True)
-    return results[:top_k]
\ No newline at end of file
+    num_labels = len(label_list)
+
+    # Partial top-k selection, then sort just those k (ties keep class order)
+    k = min(top_k, num_classes)
+    if k <= 0:
+        return []
+    idx = np.sort(np.argpartition(-probs, k - 1)[:k])
+    idx = idx[np.argsort(-probs[idx], kind="stable")]
+
+    return [
+        {"label": label_list[i] if i < num_labels else f"class_{i}", "confidence": float(probs[i])}
+        for i in idx
+    ]
\ No newline at end of file
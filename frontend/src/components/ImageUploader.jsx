@@ -50,13 +50,13 @@ function RipenessBar({ label, confidence, isTop }) {
 
 // ─── Gate rejection panel ─────────────────────────────────────────────────────
 function GateRejectionPanel({ data }) {
-  const pct = Math.round((data.gate_confidence ?? 0) * 100)
+  const pct = Math.round((data.meta?.gate_confidence ?? 0) * 100)
   return (
     <div className="animate-fade-up mt-6 rounded-2xl border border-amber-500/30 bg-amber-500/5 p-6 text-center">
       <div className="text-4xl mb-3">🚫</div>
       <h2 className="font-display text-xl font-bold text-amber-400 mb-1">Not a Guava</h2>
       <p className="text-stone-400 text-sm mb-4">
-        {data.message ?? "The image doesn't appear to contain a guava fruit."}
+        {data.meta?.gate_message ?? "The image doesn't appear to contain a guava fruit."}
       </p>
       <div className="inline-block glass rounded-xl px-4 py-2">
         <span className="font-mono text-xs text-stone-500">guava confidence: </span>
@@ -102,8 +102,8 @@ function ThermalPanel({ src }) {
               <span className="inline-block w-3 h-3 rounded-sm bg-yellow-200 ml-2" /> hot
             </div>
             <a
-              href={src}
-              download="thermal.png"
+              href={`${src}?download=1`}
+              download="thermal"
               className="text-xs text-grove-400 hover:text-grove-300 font-mono"
             >
               ↓ download
@@ -117,7 +117,7 @@ function ThermalPanel({ src }) {
 
 // ─── Results panel ────────────────────────────────────────────────────────────
 function ResultsPanel({ data }) {
-  const { predictions, thermal_image, meta } = data
+  const { predictions, thermal_url, meta } = data
   return (
     <div className="animate-fade-up mt-6 space-y-3">
       {/* Ripeness card */}
@@ -164,7 +164,7 @@ function ResultsPanel({ data }) {
       </div>
 
       {/* Thermal image */}
-      {thermal_image && <ThermalPanel src={thermal_image} />}
+      {thermal_url && <ThermalPanel src={`${API_BASE}${thermal_url}`} />}
     </div>
   )
 }
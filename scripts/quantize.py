@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+scripts/quantize.py
+===================
+Convert the Keras ripeness model to a TFLite model for CPU-only
+deployments (no FP16-capable GPU).
+
+--precision selects the conversion:
+  int8     full-integer weights and activations (default). A folder of
+           sample guava images is used as the representative dataset so
+           the converter can calibrate activation ranges; the model takes
+           uint8 input.
+  dynamic  int8 weights, float activations (dynamic-range quantization).
+           No calibration images needed.
+  fp32     plain float conversion, for comparison or the XNNPACK float path.
+
+Serve the result by pointing MODEL_PATH at the .tflite file.
+
+Usage:
+  python scripts/quantize.py backend/model/model.h5 --images path/to/guavas/
+  python scripts/quantize.py backend/model/model.h5 --precision dynamic
+  python scripts/quantize.py backend/model/model.h5 --images path/to/guavas/ \\
+      --output backend/model/model_int8.tflite --samples 100
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+
+def representative_dataset(image_dir: Path, input_shape, samples: int):
+    """Yield preprocessed images exactly as the backend feeds the model."""
+    _, h, w, channels = input_shape
+    paths = sorted(p for p in image_dir.rglob("*") if p.suffix.lower() in IMAGE_EXTS)
+    if not paths:
+        print(f"Error: No images found in {image_dir}")
+        sys.exit(1)
+
+    def gen():
+        for path in paths[:samples]:
+            img_bgr = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if img_bgr is None:
+                continue
+            if channels == 1:
+                img = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+            else:
+                img = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+            img = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+            img = img.astype(np.float32) / 255.0
+            yield [img.reshape(1, h, w, channels)]
+
+    print(f"Calibrating on {min(samples, len(paths))} of {len(paths)} images …")
+    return gen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the model to a (quantized) TFLite model")
+    parser.add_argument("model", help="Path to the Keras .h5 model")
+    parser.add_argument("--precision", choices=("int8", "dynamic", "fp32"), default="int8",
+                        help="Weight/activation precision (default: int8)")
+    parser.add_argument("--images", help="Folder of sample guava images (required for int8)")
+    parser.add_argument("--output", help="Output .tflite path (default: next to the model)")
+    parser.add_argument("--samples", type=int, default=100,
+                        help="Number of calibration images (default: 100)")
+    args = parser.parse_args()
+
+    model_path = Path(args.model)
+    output     = Path(args.output) if args.output else model_path.with_name(
+        f"{model_path.stem}_{args.precision}.tflite"
+    )
+    if not model_path.exists():
+        print(f"Error: File not found: {model_path}")
+        sys.exit(1)
+    if args.precision == "int8" and not args.images:
+        print("Error: --images is required for --precision int8")
+        sys.exit(1)
+
+    model = tf.keras.models.load_model(str(model_path), compile=False)
+    print(f"Loaded '{model_path}'  input={model.input_shape}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if args.precision != "fp32":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if args.precision == "int8":
+        converter.representative_dataset = representative_dataset(
+            Path(args.images), model.input_shape, args.samples
+        )
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+
+    tflite_model = converter.convert()
+    output.write_bytes(tflite_model)
+
+    size_mb = len(tflite_model) / (1024 * 1024)
+    print(f"\n✅  Wrote {output} ({size_mb:.1f} MB)")
+    print(f"   Serve it with MODEL_PATH={output}")
+
+
+if __name__ == "__main__":
+    main()
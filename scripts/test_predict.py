@@ -4,14 +4,21 @@ scripts/test_predict.py
 =======================
 Send a local image to the Fruit Ripeness API and print the JSON result.
 
+With --repeat N the image is sent N times over one keep-alive connection
+and the client-side latency is summarised, so connection setup does not
+skew the numbers.
+
 Usage:
   python scripts/test_predict.py path/to/fruit.jpg
   python scripts/test_predict.py path/to/fruit.jpg --url http://localhost:8000
+  python scripts/test_predict.py path/to/fruit.jpg --repeat 50
 """
 
 import argparse
 import json
+import statistics
 import sys
+import time
 from pathlib import Path
 
 try:
@@ -29,6 +36,12 @@ def main():
         default="http://localhost:8000",
         help="Base URL of the API (default: http://localhost:8000)",
     )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Number of requests to send over one connection (default: 1)",
+    )
     args = parser.parse_args()
 
     img_path = Path(args.image)
@@ -39,25 +52,42 @@ def main():
     endpoint = f"{args.url.rstrip('/')}/predict"
     print(f"Uploading '{img_path}' to {endpoint} …")
 
-    with open(img_path, "rb") as fh:
-        response = requests.post(
-            endpoint,
-            files={"file": (img_path.name, fh, "image/jpeg")},
-            timeout=60,
-        )
+    # requests encodes the multipart body in memory either way, so the file
+    # is read once and reused for every repeat
+    image_bytes = img_path.read_bytes()
+    latencies = []
+    with requests.Session() as session:
+        for _ in range(max(1, args.repeat)):
+            start = time.perf_counter()
+            response = session.post(
+                endpoint,
+                files={"file": (img_path.name, image_bytes, "image/jpeg")},
+                timeout=60,
+            )
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            if response.status_code != 200:
+                break
 
     print(f"\nHTTP {response.status_code}")
+    data = None
     try:
         data = response.json()
         print(json.dumps(data, indent=2))
-    except Exception:
+    except ValueError:
         print(response.text)
 
-    if response.status_code == 200 and data.get("success"):
-        top = data["predictions"][0]
-        pct = top["confidence"] * 100
-        print(f"\n✅  Top prediction: {top['label']} ({pct:.1f}% confidence)")
-        print(f"   Processing time: {data['meta']['processing_time_ms']:.1f} ms")
+    if len(latencies) > 1:
+        print(f"\n{len(latencies)} requests: min {min(latencies):.1f} ms | "
+              f"median {statistics.median(latencies):.1f} ms | max {max(latencies):.1f} ms")
+
+    if response.status_code == 200 and data and data.get("success"):
+        if data["predictions"]:
+            top = data["predictions"][0]
+            pct = top["confidence"] * 100
+            print(f"\n✅  Top prediction: {top['label']} ({pct:.1f}% confidence)")
+            print(f"   Processing time: {data['meta']['processing_time_ms']:.1f} ms")
+        else:
+            print(f"\n🚫  Not a guava: {data['meta']['gate_message']}")
     else:
         print("\n❌  Prediction failed. See response above.")
         sys.exit(1)